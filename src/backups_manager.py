@@ -12,12 +12,179 @@ import logging.config
 import json
 import os
 import shutil
+import stat
+import subprocess
 from datetime import datetime
 from time import perf_counter
-import math
-from multiprocessing import cpu_count
+import fcntl
+import functools
+import random
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from system_resources import get_available_cpu_count
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ARCHIVE_FORMATS = {
+    "tar": "tar",
+    "tar.gz": "gztar",
+    "tar.bz2": "bztar",
+    "tar.xz": "xztar",
+    "tar.zst": "zstdtar",
+    "zip": "zip"
+}
+ARCHIVE_FORMATS_REVERSED = {v: k for k, v in ARCHIVE_FORMATS.items()}
+TAR_BLOCKING_FACTOR = "128"
+# Default balanced tier keeps the -9 levels earlier releases used for gz, bz2, xz and zip, zstd uses its own default
+COMPRESSION_LEVELS = {
+    "fast": {"tar.gz": 1, "tar.bz2": 1, "tar.xz": 0, "tar.zst": 1, "zip": 1},
+    "balanced": {"tar.gz": 9, "tar.bz2": 9, "tar.xz": 9, "tar.zst": 3, "zip": 9},
+    "archival": {"tar.gz": 9, "tar.bz2": 9, "tar.xz": 9, "tar.zst": 19, "zip": 9}
+}
+BACKUP_TYPES = frozenset({"local_raw", "local_compressed", "s3_raw", "s3_compressed"})
+
+SOURCE_SIZE_CACHE_TTL = 60
+
+COMPRESSIBILITY_SAMPLE_FILES = 64
+COMPRESSIBILITY_SAMPLE_SIZE = 256 * 1024
+INCOMPRESSIBLE_RATIO = 0.95
+
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 1 << 30
+COPY_FALLBACK_BUFFER_SIZE = 1 << 20
+
+def copy_file(src: str, dst: str) -> str:
+    """Function to copy a file, its metadata and owner, used as copy_function for shutil.copytree
+
+    On copy-on-write filesystems (btrfs, xfs) the file is reflinked with FICLONE,
+    which shares the data extents in constant time. Otherwise data is copied in
+    kernel with os.copy_file_range, falling back to a buffered user space copy if
+    copy_file_range is not available.
+
+    Args:
+        src (str): Absolute path of the file to copy
+        dst (str): Absolute path of the copied file
+
+    Raises:
+        shutil.SpecialFileError: Exception raised if src is a named pipe, socket or device, like shutil.copyfile does
+
+    Returns:
+        str: Absolute path of the copied file
+    """
+    # Opening a named pipe blocks until something writes to it, check the file type before opening
+    # and open without blocking so a file swapped for a pipe in between does not hang the backup
+    fd = os.open(src, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        src_stat = os.fstat(fd)
+        if not stat.S_ISREG(src_stat.st_mode):
+            if stat.S_ISFIFO(src_stat.st_mode):
+                raise shutil.SpecialFileError(f"`{src}` is a named pipe")
+            raise shutil.SpecialFileError(f"`{src}` is a socket or device")
+        os.set_blocking(fd, True)
+        fsrc = open(fd, 'rb')
+    except BaseException:
+        os.close(fd)
+        raise
+    
+    with fsrc, open(dst, 'wb') as fdst:
+        os.fchown(fdst.fileno(), src_stat.st_uid, src_stat.st_gid)
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_CHUNK_SIZE) > 0:
+                    pass
+            except (AttributeError, OSError):
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst, COPY_FALLBACK_BUFFER_SIZE)
+    shutil.copystat(src, dst)
+    return dst
+
+def link_or_copy_file(src: str, dst: str, source_path: str, previous_backup_path: str) -> str:
+    """Function to hard link a file from the previous backup if it did not change, copy the file otherwise
+
+    File is considered unchanged if its size, modification time, mode and owner
+    match the file at the same relative path in the previous backup.
+
+    Args:
+        src (str): Absolute path of the file to copy
+        dst (str): Absolute path of the copied file
+        source_path (str): Absolute path of the backup source src is relative to
+        previous_backup_path (str): Absolute path of the previous raw backup
+
+    Returns:
+        str: Absolute path of the copied file
+    """
+    # relpath copes with source_path given with a trailing separator, e.g. SOURCE_PATH=/data/
+    previous_file = os.path.join(previous_backup_path, os.path.relpath(src, source_path))
+    try:
+        src_stat = os.stat(src)
+        previous_stat = os.lstat(previous_file)
+        if (src_stat.st_size == previous_stat.st_size
+                and src_stat.st_mtime_ns == previous_stat.st_mtime_ns
+                and src_stat.st_mode == previous_stat.st_mode
+                and src_stat.st_uid == previous_stat.st_uid
+                and src_stat.st_gid == previous_stat.st_gid):
+            os.link(previous_file, dst)
+            return dst
+    except OSError:
+        pass
+    return copy_file(src, dst)
+
+def start_pipeline(commands: list, stdout=None) -> list:
+    """Function to start a pipeline of commands without a shell, stdout of each command is connected to stdin of the next one
+
+    Args:
+        commands (list): Argument lists of the commands to run
+        stdout (optional): File object the last command writes to. Defaults to None, which opens a pipe.
+
+    Returns:
+        list: Started processes, in pipeline order
+    """
+    processes = []
+    previous_stdout = None
+    try:
+        for index, command in enumerate(commands):
+            is_last = index == len(commands) - 1
+            process = subprocess.Popen(command,
+                                       stdin=previous_stdout,
+                                       stdout=stdout if is_last and stdout is not None else subprocess.PIPE)
+            if previous_stdout is not None:
+                previous_stdout.close()
+            previous_stdout = process.stdout
+            processes.append(process)
+    except Exception:
+        for process in processes:
+            process.kill()
+            process.wait()
+        raise
+    return processes
+
+def wait_pipeline(processes: list) -> bool:
+    """Function to wait for all processes of a pipeline to finish
+
+    Args:
+        processes (list): Processes returned by start_pipeline
+
+    Returns:
+        bool: True if all processes exited with status 0, False otherwise
+    """
+    return_codes = [process.wait() for process in processes]
+    return all(return_code == 0 for return_code in return_codes)
 
 class BackupManager():
+    __slots__ = ("logger", "source_path", "target_path", "_target_join",
+                 "is_compression_enabled", "archive_format", "compression_level",
+                 "raw_backup_keep", "compressed_backup_keep", "s3_raw_keep", "s3_compressed_keep",
+                 "ignored_extensions", "link_unchanged_files", "skip_incompressible", "scan_inode_order", "_source_size_cache", "_backup_dir_size_cache", "_backup_steps", "s3handler",
+                 "backup_info_lock", "backup_info_file", "backups")
+    
     def __init__(self, 
                  logger=None, 
                  source_path: str = "/source", 
@@ -25,14 +192,18 @@ class BackupManager():
                  s3handler=None, 
                  backup_info_file: str = None,
                  is_compression_enabled: bool = True,
-                 archive_format: str = "tar.gz",
+                 archive_format: str = "tar.zst",
+                 compression_level: str = "balanced",
                  raw_backup_keep: int = 1, 
                  compressed_backup_keep: int = 7, 
                  s3_raw_keep: int = 1, 
                  s3_compressed_keep: int = 3,
                  ignored_extensions: list = None,
                  puid: int = None,
-                 pgid: int = None,):
+                 pgid: int = None,
+                 link_unchanged_files: bool = True,
+                 skip_incompressible: bool = False,
+                 scan_inode_order: bool = True,):
         """BackupManager class constructor
 
         Args:
@@ -41,32 +212,40 @@ class BackupManager():
             target_path (str, optional): Custom absolute path where backups will be saved. Defaults to "/target".
             s3handler (_type_, optional): Handle for S3Handler object. Defaults to None.
             backup_info_file (str, optional): Custom backup_info.json file path. Defaults to None.
+            compression_level (str, optional): Compression level tier, one of fast, balanced (levels of earlier releases, zstd default level) or archival. Defaults to "balanced".
             raw_backup_keep (int, optional): Number of raw backups to keep. Defaults to 1.
             compressed_backup_keep (int, optional): Number of compressed backups to keep. Defaults to 7.
             s3_raw_keep (int, optional): Number of raw backups to keep in S3. Defaults to 1.
             s3_compressed_keep (int, optional): Number of compressed backups to keep in S3. Defaults to 3.
+            link_unchanged_files (bool, optional): Hard link files unchanged since the previous raw backup instead of copying them. Defaults to True.
+            skip_incompressible (bool, optional): Store backups as uncompressed tar instead of archive_format if a sample of their files does not compress. Defaults to False.
+            scan_inode_order (bool, optional): Visit directory entries in inode order when measuring sizes, reduces seeking on rotational disks. Defaults to True.
 
         Raises:
             FileNotFoundError: Exception raised if source_path does not exist
             FileNotFoundError: Exception raised if target_path does not exist
+            ValueError: Exception raised if archive_format or compression_level is not supported or a keep value is not a non-negative integer
         """
         if logger is None:
-            logging.config.fileConfig("log.conf")
             self.logger = logging.getLogger('pybackupper_logger')
+            # log.conf is parsed only once per process, later instances reuse the configured logger
+            if not self.logger.handlers:
+                logging.config.fileConfig("log.conf")
         else:
             self.logger = logger
         
         if not os.path.exists(source_path):
-            logger.error(f"Source path {source_path} does not exist")
+            self.logger.error(f"Source path {source_path} does not exist")
             raise FileNotFoundError(f"Source path {source_path} does not exist")
             
         self.source_path = source_path
                 
         if not os.path.exists(target_path):
-            logger.error(f"Target path {target_path} does not exist")         
+            self.logger.error(f"Target path {target_path} does not exist")
             raise FileNotFoundError(f"Target path {target_path} does not exist")
         
         self.target_path = target_path
+        self._target_join = (target_path.rstrip(os.sep) + os.sep).__add__
         
         self.is_compression_enabled = is_compression_enabled
         self.archive_format = archive_format
@@ -74,17 +253,53 @@ class BackupManager():
         if self.is_compression_enabled and self.map_archive_format(self.archive_format) is None:
             self.logger.error(f"Archive format {self.archive_format} not supported")
             raise ValueError(f"Archive format {self.archive_format} not supported")
+        
+        if compression_level not in COMPRESSION_LEVELS:
+            self.logger.error(f"Compression level {compression_level} not supported")
+            raise ValueError(f"Compression level {compression_level} not supported")
+        self.compression_level = compression_level
+        
+        for name, value in (("raw_backup_keep", raw_backup_keep),
+                            ("compressed_backup_keep", compressed_backup_keep),
+                            ("s3_raw_keep", s3_raw_keep),
+                            ("s3_compressed_keep", s3_compressed_keep)):
+            self._check_non_negative_int(name, value)
                      
         self.raw_backup_keep = raw_backup_keep
         self.compressed_backup_keep = compressed_backup_keep
         self.s3_raw_keep = s3_raw_keep
         self.s3_compressed_keep = s3_compressed_keep
         self.ignored_extensions = ignored_extensions
+        self.link_unchanged_files = link_unchanged_files
+        self.skip_incompressible = skip_incompressible
+        self.scan_inode_order = scan_inode_order
+        self._source_size_cache = {}
+        self._backup_dir_size_cache = {}
         
         self.s3handler = s3handler
         
-        self.backups = self.load_backup_info_from_file(backup_info_file)
+        self.backup_info_lock = threading.Lock()
+        if backup_info_file is None:
+            backup_info_file = self._target_join("backup_info.json")
+        self.backup_info_file = backup_info_file
+        
+        self.backups = self.load_backup_info_from_file()
         self.verify_backup_info()
+        self._backup_steps = self._build_backup_steps()
+    
+    def _check_non_negative_int(self, name: str, value: int):
+        """Function to validate that a keep value is a non-negative integer
+
+        Args:
+            name (str): Name of the validated argument, used in the error message
+            value (int): Value to validate
+
+        Raises:
+            ValueError: Exception raised if value is not a non-negative integer
+        """
+        if not isinstance(value, int) or value < 0:
+            self.logger.error(f"Value of {name} must be a non-negative integer, not {value}")
+            raise ValueError(f"Value of {name} must be a non-negative integer")
     
     def save_backup_info_to_file(self, file_path: str=None, backup_info: dict = None) -> bool:
         """Function to save the backup_info dictionary to a file
@@ -97,14 +312,23 @@ class BackupManager():
             bool: True if the file was saved successfully, False otherwise
         """
         if file_path is None:
-            file_path = os.path.join(self.target_path, "backup_info.json")
+            file_path = self.backup_info_file
                     
         if backup_info is None:
             backup_info = self.backups
             
+        temp_file_path = file_path + ".tmp"
         try:
-            with open(file_path, 'w') as file:
-                json.dump(backup_info, file, indent=4)
+            with self.backup_info_lock:
+                if orjson is not None:
+                    data = orjson.dumps(backup_info, option=orjson.OPT_INDENT_2)
+                else:
+                    data = json.dumps(backup_info, indent=4).encode()
+                with open(temp_file_path, 'wb') as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_file_path, file_path)
             self.logger.debug(f"Backup info saved in file {file_path}")
         except Exception as e:
             self.logger.error(e, exc_info=True)
@@ -120,11 +344,12 @@ class BackupManager():
             dict: backup_info dictionary
         """
         if file_path is None:
-            file_path = os.path.join(self.target_path, "backup_info.json")
+            file_path = self.backup_info_file
             
         try:
-            with open(file_path, 'r') as file:
-                backup_info = json.load(file)
+            with open(file_path, 'rb') as file:
+                data = file.read()
+            backup_info = orjson.loads(data) if orjson is not None else json.loads(data)
             self.logger.debug(f"Backup info loaded from file {file_path}")
         except Exception as e:
             self.logger.warning(e)
@@ -135,7 +360,7 @@ class BackupManager():
                 "s3_raw": [],
                 "s3_compressed": []            
             }
-            self.save_backup_info_to_file(backup_info=default_backup_info)
+            self.save_backup_info_to_file(file_path=file_path, backup_info=default_backup_info)
             return default_backup_info
         return backup_info
     
@@ -151,76 +376,76 @@ class BackupManager():
         if target_path is None:
             target_path = self.target_path
 
-        if not os.path.exists(target_path):
-            self.logger.error(f"Target path {target_path} does not exist")
-            return False
-             
-        directories = [f for f in os.listdir(target_path) if os.path.isdir(os.path.join(target_path, f))]
-        
-        for directory in directories:
-            if directory not in self.backups["local_raw"]:
-                self.logger.warning(f"Backup {directory} not listed in backup info")
-                self.backups["local_raw"].append(directory)
-                self.save_backup_info_to_file()
-        
-        for backup in self.backups["local_raw"]:
-            if backup not in directories:
-                self.logger.warning(f"Backup {backup} listed in backup info but not found in target path")
-                self.backups["local_raw"].remove(backup)
-                self.save_backup_info_to_file()
-                
-        if self.is_compression_enabled:
-            archives = [f for f in os.listdir(target_path) if os.path.isfile(os.path.join(target_path, f))]
-            try:
-                archives.remove("backup_info.json")
-            except ValueError:
-                pass
-            
-            for archive in archives:
-                if archive not in self.backups["local_compressed"]:
-                    self.logger.warning(f"Backup {archive} not listed in backup info")
-                    self.backups["local_compressed"].append(archive)
-                    self.save_backup_info_to_file()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            s3_listing = executor.submit(self.s3handler.list_root) if self.s3handler is not None else None
             
-            for backup in self.backups["local_compressed"]:
-                if backup not in archives:
-                    self.logger.warning(f"Backup {backup} listed in backup info but not found in target path")
-                    self.backups["local_compressed"].remove(backup)
-                    self.save_backup_info_to_file()
-        
-        if self.s3handler is not None:
-            s3_directories = self.s3handler.list_directories()
-            
-            for directory in s3_directories:
-                if directory not in self.backups["s3_raw"]:
-                    self.logger.warning(f"Backup {directory} not listed in backup info")
-                    self.backups["s3_raw"].append(directory)
-                    self.save_backup_info_to_file()
+            try:
+                entries = os.scandir(target_path)
+            except FileNotFoundError:
+                self.logger.error(f"Target path {target_path} does not exist")
+                return False
+                 
+            is_modified = False
+            directories = []
+            archives = []
+            backup_info_file_names = {os.path.basename(self.backup_info_file), os.path.basename(self.backup_info_file) + ".tmp"}
+            with entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        directories.append(entry.name)
+                    elif entry.is_file() and entry.name not in backup_info_file_names:
+                        archives.append(entry.name)
             
-            for backup in self.backups["s3_raw"]:
-                if backup not in s3_directories:
-                    self.logger.warning(f"Backup {backup} listed in backup info but not found in s3")
-                    self.backups["s3_raw"].remove(backup)
-                    self.save_backup_info_to_file()
+            is_modified |= self._reconcile_backup_list("local_raw", directories, "target path")
                     
             if self.is_compression_enabled:
-                s3_archives = self.s3handler.list_files()
-                
-                for archive in s3_archives:
-                    if archive not in self.backups["s3_compressed"]:
-                        self.logger.warning(f"Backup {archive} not listed in backup info")
-                        self.backups["s3_compressed"].append(archive)
-                        self.save_backup_info_to_file()
-                
-                for backup in self.backups["s3_compressed"]:
-                    if backup not in s3_archives:
-                        self.logger.warning(f"Backup {backup} listed in backup info but not found in s3")
-                        self.backups["s3_compressed"].remove(backup)
-                        self.save_backup_info_to_file()
-                
+                is_modified |= self._reconcile_backup_list("local_compressed", archives, "target path")
+            
+            if s3_listing is not None:
+                s3_directories, s3_archives = s3_listing.result()
+                is_modified |= self._reconcile_backup_list("s3_raw", s3_directories, "s3")
+                        
+                if self.is_compression_enabled:
+                    is_modified |= self._reconcile_backup_list("s3_compressed", s3_archives, "s3")
+        
+        if is_modified:
+            return self.save_backup_info_to_file()
         return True
         
     
+    def _reconcile_backup_list(self, backup_type: str, found_backups: list, location: str) -> bool:
+        """Function to reconcile a backup info list with the backups actually found
+
+        Args:
+            backup_type (str): Type of backup to reconcile (local_raw, local_compressed, s3_raw, s3_compressed)
+            found_backups (list): Names of the backups found in location
+            location (str): Location of the backups, used in log messages
+
+        Returns:
+            bool: True if the backup info list was modified, False otherwise
+        """
+        backups = self.backups[backup_type]
+        listed_backups = set(backups)
+        found_backups_set = set(found_backups)
+        is_modified = False
+        
+        for backup in found_backups:
+            if backup not in listed_backups:
+                self.logger.warning(f"Backup {backup} not listed in backup info")
+                backups.append(backup)
+                listed_backups.add(backup)
+                is_modified = True
+        
+        missing_backups = [backup for backup in backups if backup not in found_backups_set]
+        for backup in missing_backups:
+            self.logger.warning(f"Backup {backup} listed in backup info but not found in {location}")
+        
+        if missing_backups:
+            backups[:] = [backup for backup in backups if backup in found_backups_set]
+            is_modified = True
+        
+        return is_modified
+    
     def create_raw_backup(self, backup_name: str = None, backup_path: str = None, source_path: str = None) -> bool:
         """Function to create a raw backup
 
@@ -236,7 +461,7 @@ class BackupManager():
             backup_name = datetime.today().strftime("%Y_%m_%d_%H_%M_%S")
         
         if backup_path is None:
-            backup_path = os.path.join(self.target_path, backup_name)
+            backup_path = self._target_join(backup_name)
             
         if source_path is None:
             source_path = self.source_path
@@ -245,50 +470,49 @@ class BackupManager():
             self.logger.error(f"Source path {source_path} does not exist")
             return False
         
-        if os.path.exists(backup_path):
-            logging.warning(f"Backup {backup_path} already exists")
+        copy_function = copy_file
+        if self.link_unchanged_files and len(self.backups["local_raw"]) > 0:
+            previous_backup_path = self._target_join(self.backups["local_raw"][-1])
+            self.logger.debug(f"Hard linking files unchanged since backup {previous_backup_path}")
+            copy_function = functools.partial(link_or_copy_file, source_path=source_path, previous_backup_path=previous_backup_path)
+        
+        try:
+            os.makedirs(backup_path)
+            ignore = shutil.ignore_patterns(*self.ignored_extensions) if self.ignored_extensions else None
+            with os.scandir(source_path) as entries:
+                subtrees = [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+            if ignore is not None:
+                ignored_subtrees = ignore(source_path, subtrees)
+                subtrees = [subtree for subtree in subtrees if subtree not in ignored_subtrees]
+            
+            def ignore_top_level(path: str, names: list) -> set:
+                ignored_names = set(subtrees) if path == source_path else set()
+                if ignore is not None:
+                    ignored_names.update(ignore(path, names))
+                return ignored_names
+            
+            with ThreadPoolExecutor(max_workers=min(32, get_available_cpu_count())) as executor:
+                futures = [executor.submit(shutil.copytree, source_path, backup_path, symlinks=True, ignore_dangling_symlinks=True,
+                                           ignore=ignore_top_level, copy_function=copy_function, dirs_exist_ok=True)]
+                for subtree in subtrees:
+                    futures.append(executor.submit(shutil.copytree, os.path.join(source_path, subtree), os.path.join(backup_path, subtree),
+                                                   symlinks=True, ignore_dangling_symlinks=True, ignore=ignore, copy_function=copy_function))
+                for future in futures:
+                    future.result()
+            shutil.copystat(source_path, backup_path)
+            self.logger.debug(f"Backup {backup_name} created")
+        except FileExistsError:
+            self.logger.warning(f"Backup {backup_path} already exists")
             if backup_name not in self.backups["local_raw"]:
                 self.backups["local_raw"].append(backup_name)
                 self.save_backup_info_to_file()
             return True
-                
-        try:
-            shutil.copytree(source_path, backup_path, symlinks=True, ignore_dangling_symlinks=True, ignore=shutil.ignore_patterns(*self.ignored_extensions))
-            self.logger.debug(f"Backup {backup_name} created")
         except Exception as e:
             self.logger.error(e, exc_info=True)
             return False
                 
-        for root, dirs, files in os.walk(backup_path):
-            for file in files:
-                try:
-                    source_file = os.path.join(root.replace(backup_path, self.source_path), file)
-                    source_file_stat = os.stat(source_file)
-                    target_file = os.path.join(root, file)
-                    self.logger.debug(f"Copying stats from {source_file} to {target_file}")
-                    shutil.copymode(source_file, target_file)
-                    self.logger.debug(f"Chowning {target_file} to {source_file_stat.st_uid}:{source_file_stat.st_gid}")
-                    shutil.chown(target_file, user=source_file_stat.st_uid, group=source_file_stat.st_gid)
-                except FileNotFoundError:
-                    self.logger.error(f"File {source_file} not found")
-                except Exception as e:
-                    self.logger.error(e, exc_info=True)
-                    return False
-            
-            for dir in dirs:
-                try:
-                    source_dir = os.path.join(root.replace(backup_path, self.source_path), dir)
-                    source_dir_stat = os.stat(source_dir)
-                    target_dir = os.path.join(root, dir)
-                    self.logger.debug(f"Copying stats from {source_dir} to {target_dir}")
-                    shutil.copymode(source_dir, target_dir)
-                    self.logger.debug(f"Chowning {target_dir} to {source_dir_stat.st_uid}:{source_dir_stat.st_gid}")
-                    shutil.chown(target_dir, user=source_dir_stat.st_uid, group=source_dir_stat.st_gid)
-                except FileNotFoundError:
-                    self.logger.error(f"Directory {source_dir} not found")
-                except Exception as e:
-                    self.logger.error(e, exc_info=True)
-                    return False
+        if not self._copy_tree_owners(source_path, backup_path):
+            return False
         
         if backup_name not in self.backups["local_raw"]:           
             self.backups["local_raw"].append(backup_name)
@@ -297,7 +521,7 @@ class BackupManager():
         return True
     
     def map_archive_format(self, archive_format: str, reverse:bool= False) -> str:
-        """Function to map archive formatsf
+        """Function to map archive formats
 
         Args:
             archive_format (str): Archive format to map
@@ -310,28 +534,206 @@ class BackupManager():
             self.logger.error(f"Empty archive format")
             return None
         
-        mapping = {
-            "tar": "tar",
-            "tar.gz": "gztar",
-            "tar.bz2": "bztar",
-            "tar.xz": "xztar",
-            "zip": "zip"
-        }
-        
-        for k, v in mapping.items():
-            if reverse:
-                if v == archive_format:
-                    return k
-            if k == archive_format:
-                return v
-        return None     
+        if reverse:
+            return ARCHIVE_FORMATS_REVERSED.get(archive_format)
+        return ARCHIVE_FORMATS.get(archive_format)
+    
+    def estimate_compressibility(self, backup_path: str) -> float:
+        """Function to estimate how well a backup compresses by compressing the beginning of a sample of its files
+
+        Sampled files are compressed as one stream, like they are inside a tar archive,
+        so per-stream overhead does not make trees of small files look incompressible.
+
+        Args:
+            backup_path (str): Absolute path of the backup to sample
+
+        Returns:
+            float: Ratio of compressed to original sample size, 0.0 if there was nothing to sample
+        """
+        # Sample is spread over the top-level subtrees, a small config directory next to a large
+        # media library must not decide for the whole backup only because it is walked first
+        root_files = []
+        subtrees = []
+        try:
+            with os.scandir(backup_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subtrees.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        root_files.append(entry.path)
+        except OSError:
+            return 0.0
+        
+        if len(subtrees) > COMPRESSIBILITY_SAMPLE_FILES:
+            subtrees = random.sample(subtrees, COMPRESSIBILITY_SAMPLE_FILES)
+        quota = max(1, COMPRESSIBILITY_SAMPLE_FILES // (len(subtrees) + 1))
+        
+        sample = root_files[:quota]
+        for subtree in subtrees:
+            subtree_sample = []
+            directories = [subtree]
+            # Walk of each subtree stops as soon as its share is sampled, the estimate must stay cheap compared to the backup
+            while directories and len(subtree_sample) < quota:
+                try:
+                    entries = os.scandir(directories.pop())
+                except OSError:
+                    continue
+                with entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            subtree_sample.append(entry.path)
+                            if len(subtree_sample) == quota:
+                                break
+            sample.extend(subtree_sample)
+        
+        sample_size = 0
+        compressed_size = 0
+        compressor = zlib.compressobj(1)
+        for file_path in sample:
+            try:
+                with open(file_path, 'rb') as file:
+                    data = file.read(COMPRESSIBILITY_SAMPLE_SIZE)
+            except OSError:
+                continue
+            compressed_size += len(compressor.compress(data))
+            sample_size += len(data)
+        compressed_size += len(compressor.flush())
+        
+        if sample_size == 0:
+            return 0.0
+        return compressed_size / sample_size
+    
+    def get_default_archive_format(self, backup_path: str) -> str:
+        """Function to get the archive format to compress a backup to when no custom format is given
+
+        If skip_incompressible is enabled, backups whose sampled files do not compress are
+        stored as uncompressed tar, compressing e.g. media libraries only burns CPU time.
+        Otherwise the configured archive format is always used.
+
+        Args:
+            backup_path (str): Absolute path of the backup to compress
+
+        Returns:
+            str: Archive format to compress to
+        """
+        if not self.skip_incompressible or self.archive_format == "tar":
+            return self.archive_format
+        
+        ratio = self.estimate_compressibility(backup_path)
+        if ratio > INCOMPRESSIBLE_RATIO:
+            self.logger.warning(f"Backup {backup_path} sample compresses to {ratio:.0%} of its size, storing it as tar instead of {self.archive_format}")
+            return "tar"
+        return self.archive_format
+    
+    def get_compress_command(self, archive_format: str) -> list:
+        """Function to get the command compressing tar stream from stdin to stdout
+
+        Args:
+            archive_format (str): Archive format to compress to
+
+        Returns:
+            list: Command arguments, None if the tar stream is stored uncompressed
+        """
+        levels = COMPRESSION_LEVELS[self.compression_level]
+        # Formats without a compression level, i.e. plain tar, are stored uncompressed
+        if archive_format not in levels:
+            return None
+        
+        threads = str(get_available_cpu_count())
+        level = f"-{levels[archive_format]}"
+        match archive_format:
+            case "tar.gz":
+                if shutil.which("pigz") is None:
+                    self.logger.warning("pigz not found, compressing with single-threaded gzip")
+                    return ["gzip", level, "-c"]
+                return ["pigz", level, "-N", "-p", threads]
+            case "tar.bz2":
+                if shutil.which("pbzip2") is None:
+                    self.logger.warning("pbzip2 not found, compressing with single-threaded bzip2")
+                    return ["bzip2", level, "-c"]
+                return ["pbzip2", level, "-c", f"-p{threads}"]
+            case "tar.xz":
+                if shutil.which("pixz") is None:
+                    self.logger.warning("pixz not found, compressing with xz")
+                    return ["xz", level, "-c", f"-T{threads}"]
+                return ["pixz", level, "-p", threads]
+            case "tar.zst":
+                return ["zstd", level, "--long", f"-T{threads}", "-q", "-c"]
+            case "zip":
+                if shutil.which("pigz") is None:
+                    # zip reads the tar stream from stdin when input and output are both "-"
+                    self.logger.warning("pigz not found, compressing with single-threaded zip")
+                    return ["zip", level, "-q", "-", "-"]
+                return ["pigz", level, "-N", "--zip", "-p", threads]
+        return None
+    
+    def get_archive_commands(self, backup_path: str, archive_format: str) -> list:
+        """Function to get the pipeline of commands writing the backup archive to stdout
+
+        Args:
+            backup_path (str): Absolute path of the backup to archive
+            archive_format (str): Archive format to compress to
+
+        Returns:
+            list: Argument lists of the pipeline commands
+        """
+        commands = [["tar", "-b", TAR_BLOCKING_FACTOR, "-cf", "-", "-C", os.path.dirname(backup_path), os.path.basename(backup_path)]]
+        compress_command = self.get_compress_command(archive_format)
+        if compress_command is not None:
+            commands.append(compress_command)
+        return commands
+    
+    def _copy_tree_owners(self, source_path: str, backup_path: str) -> bool:
+        """Function to copy owner of every directory and symlink in the source tree to its copy in the backup
+
+        Regular files are chowned by copy_file while they are copied and shutil.copytree
+        already copies the mode of directories, so only their owners are left to copy.
+
+        Args:
+            source_path (str): Absolute path of the backup source
+            backup_path (str): Absolute path of the backup copied from source_path
+
+        Returns:
+            bool: True if the owners were copied, False otherwise
+        """
+        prefix_length = len(backup_path)
+        directories = [backup_path]
+        while directories:
+            try:
+                entries = os.scandir(directories.pop())
+            except Exception as e:
+                self.logger.error(e, exc_info=True)
+                return False
+            
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif not entry.is_symlink():
+                        continue
+                    
+                    target_entry = entry.path
+                    source_entry = source_path + target_entry[prefix_length:]
+                    try:
+                        source_entry_stat = os.stat(source_entry, follow_symlinks=False)
+                        self.logger.debug("Chowning %s to %s:%s", target_entry, source_entry_stat.st_uid, source_entry_stat.st_gid)
+                        os.chown(target_entry, source_entry_stat.st_uid, source_entry_stat.st_gid, follow_symlinks=False)
+                    except FileNotFoundError:
+                        self.logger.error("File %s not found", source_entry)
+                    except Exception as e:
+                        self.logger.error(e, exc_info=True)
+                        return False
+        
+        return True
     
     def compress_backup(self, backup_path: str = None, archive_format: str = None) -> bool:
         """Function to compress a backup
 
         Args:
             backup_path (str, optional): Custom absolute path to read the backup from. Defaults to None.
-            archive_format (str, optional): Custom arichve format to compress to. Defaults to "tar.gz".
+            archive_format (str, optional): Custom arichve format to compress to. Defaults to None.
 
         Returns:
             bool: True if the backup was compressed, False otherwise
@@ -340,54 +742,43 @@ class BackupManager():
             if len(self.backups["local_raw"]) == 0:
                 self.logger.error(f"No local raw backups found")
                 return False
-            backup_path = os.path.join(self.target_path, self.backups["local_raw"][-1])
+            backup_path = self._target_join(self.backups["local_raw"][-1])
         
         if not os.path.exists(backup_path):
             self.logger.error(f"Backup path {backup_path} does not exist")
             return False
         
         if archive_format is None:
-            archive_format = self.archive_format
+            archive_format = self.get_default_archive_format(backup_path)
         if self.map_archive_format(archive_format) is None:
             self.logger.error(f"Archive format {archive_format} not supported")
             return False
         
         archive_path = backup_path + "." + archive_format
-        
-        if os.path.exists(archive_path):
-            logging.warning(f"Archive {archive_path} already exists")
-            if os.path.basename(archive_path) not in self.backups["local_compressed"]:
-                self.backups["local_compressed"].append(os.path.basename(archive_path))
-                self.save_backup_info_to_file()
-            return True  
-    
-        archive_name = os.path.basename(archive_path)    
+        archive_name = os.path.basename(archive_path)
                                        
         try:
-            shutil_archive_format = self.map_archive_format(archive_format)
             self.logger.debug(f"Compressing backup {backup_path} to {archive_path}")
-            # shutil.make_archive(backup_path, shutil_archive_format, backup_path)
-            
-            match archive_format:
-                case "tar":
-                    command = f"tar -cf {archive_path} {backup_path}"
-                case "tar.gz":
-                    command = f"""tar --use-compress-program="pigz -9 -N" -cf {archive_path} {backup_path}"""
-                case "tar.bz2":
-                    command = f"tar -cjf {archive_path} {backup_path}"
-                case "tar.xz":
-                    command = f"""tar --use-compress-program="pixz -9" -cf {archive_path} {backup_path}"""
-                case "zip":
-                    command = f"""tar --use-compress-program="pigz -9 -N --zip" -cf {archive_path} {backup_path}"""
-                                    
-            os.system(command)               
+            with open(archive_path, 'xb') as archive:
+                if not wait_pipeline(start_pipeline(self.get_archive_commands(backup_path, archive_format), stdout=archive)):
+                    raise RuntimeError(f"Failed to compress backup {backup_path}")
                 
             self.logger.debug(f"Backup {backup_path} compressed to {archive_name}")
+        except FileExistsError:
+            self.logger.warning(f"Archive {archive_path} already exists")
+            if archive_name not in self.backups["local_compressed"]:
+                self.backups["local_compressed"].append(archive_name)
+                self.save_backup_info_to_file()
+            return True
         except Exception as e:
             self.logger.error(e, exc_info=True)
+            try:
+                os.remove(archive_path)
+            except FileNotFoundError:
+                pass
             return False
         
-        self.backups["local_compressed"].append(os.path.basename(archive_name))
+        self.backups["local_compressed"].append(archive_name)
         self.save_backup_info_to_file()
         
         return True
@@ -413,7 +804,7 @@ class BackupManager():
             if len(self.backups["local_raw"]) == 0:
                 self.logger.error(f"No local raw backups found")
                 return False       
-            backup_path = os.path.join(self.target_path, self.backups["local_raw"][-1])
+            backup_path = self._target_join(self.backups["local_raw"][-1])
             
         if not os.path.exists(backup_path):
             logging.error(f"Backup {backup_path} does not exist")
@@ -425,7 +816,9 @@ class BackupManager():
             logging.warning(f"Backup {backup_path} already exists in S3")
             return True
 
-        self.s3handler.upload_directory(backup_path, backup_name)
+        if not self.s3handler.upload_directory(backup_path, backup_name):
+            self.logger.error(f"Backup {backup_path} not sent to S3")
+            return False
         self.logger.debug(f"Backup {backup_path} sent to S3")
         self.backups["s3_raw"].append(backup_name)
         self.save_backup_info_to_file()
@@ -453,7 +846,7 @@ class BackupManager():
             if len(self.backups["local_compressed"]) == 0:
                 self.logger.error(f"No local compressed backups found")
                 return False       
-            archive_path = os.path.join(self.target_path, self.backups["local_compressed"][-1])
+            archive_path = self._target_join(self.backups["local_compressed"][-1])
             
         if not os.path.exists(archive_path):
             logging.error(f"Archive {archive_path} does not exist")
@@ -465,19 +858,87 @@ class BackupManager():
             logging.warning(f"Archive {archive_path} already exists in S3")
             return True
 
-        self.s3handler.upload_file(archive_path, archive_name)
+        if not self.s3handler.upload_file(archive_path, archive_name):
+            self.logger.error(f"Archive {archive_path} not sent to S3")
+            return False
         self.logger.debug(f"Archive {archive_path} sent to S3")
         self.backups["s3_compressed"].append(archive_name)
         self.save_backup_info_to_file()
         
         return True
     
-    def delete_raw_backup(self, backup_name: str = None, backup_path: str = None) -> bool:
+    def compress_and_send_to_s3(self, backup_path: str = None, archive_format: str = None) -> bool:
+        """Function to compress a backup and stream the archive to S3 without saving it locally
+
+        Args:
+            backup_path (str, optional): Custom absolute path to read the backup from. Defaults to None.
+            archive_format (str, optional): Custom archive format to compress to. Defaults to None.
+
+        Returns:
+            bool: True if the archive was sent to S3, False otherwise
+        """
+        if self.s3handler is None:
+            self.logger.error(f"No S3 handler found")
+            return False
+        
+        if self.s3_compressed_keep == 0:
+            self.logger.error(f"S3 compressed backups disabled")
+            return True
+        
+        if backup_path is None:
+            if len(self.backups["local_raw"]) == 0:
+                self.logger.error(f"No local raw backups found")
+                return False
+            backup_path = self._target_join(self.backups["local_raw"][-1])
+        
+        if not os.path.exists(backup_path):
+            self.logger.error(f"Backup path {backup_path} does not exist")
+            return False
+        
+        if archive_format is None:
+            archive_format = self.get_default_archive_format(backup_path)
+        if self.map_archive_format(archive_format) is None:
+            self.logger.error(f"Archive format {archive_format} not supported")
+            return False
+        
+        archive_name = os.path.basename(backup_path) + "." + archive_format
+        
+        if archive_name in self.backups["s3_compressed"]:
+            self.logger.warning(f"Archive {archive_name} already exists in S3")
+            return True
+        
+        self.logger.debug(f"Compressing backup {backup_path} to S3 archive {archive_name}")
+        try:
+            processes = start_pipeline(self.get_archive_commands(backup_path, archive_format))
+        except Exception as e:
+            self.logger.error(e, exc_info=True)
+            return False
+        
+        is_uploaded = self.s3handler.upload_fileobj(processes[-1].stdout, archive_name)
+        if not is_uploaded:
+            for process in processes:
+                process.kill()
+        processes[-1].stdout.close()
+        
+        if not wait_pipeline(processes) or not is_uploaded:
+            self.logger.error(f"Failed to compress backup {backup_path} to S3")
+            if is_uploaded:
+                self.s3handler.delete_file(archive_name)
+            return False
+        
+        self.logger.debug(f"Backup {backup_path} compressed to S3 archive {archive_name}")
+        self.backups["s3_compressed"].append(archive_name)
+        self.save_backup_info_to_file()
+        
+        return True
+    
+    def delete_raw_backup(self, backup_name: str = None, backup_path: str = None, save_backup_info: bool = True) -> bool:
         """Function to delete a raw backup
 
         Args:
             backup_name (str, optional): Custom backup name to be deleted. Defaults to None.
             backup_path (str, optional): Custom absolute path were the backups are saved. Defaults to None.
+            save_backup_info (bool, optional): Save backup info to file after deletion. Defaults to True.
 
         Returns:
             bool: True if the backup was deleted, False otherwise
@@ -489,30 +950,31 @@ class BackupManager():
             backup_name = self.backups["local_raw"][0]
             
         if backup_path is None:
-            backup_path = os.path.join(self.target_path, backup_name)
+            backup_path = self._target_join(backup_name)
             
-        if not os.path.exists(backup_path):
-            logging.error(f"Backup {backup_path} does not exist")
-            return False
-        
         try:
             shutil.rmtree(backup_path)
             self.logger.debug(f"Backup {backup_path} deleted")
+        except FileNotFoundError:
+            self.logger.error(f"Backup {backup_path} does not exist")
+            return False
         except Exception as e:
             self.logger.error(e, exc_info=True)
             return False
         
         self.backups["local_raw"].remove(backup_name)
-        self.save_backup_info_to_file()
+        if save_backup_info:
+            self.save_backup_info_to_file()
         
         return True
     
-    def delete_compressed_backup(self, backup_name: str = None, backup_path: str = None) -> bool:
+    def delete_compressed_backup(self, backup_name: str = None, backup_path: str = None, save_backup_info: bool = True) -> bool:
         """Function to delete a compressed backup
 
         Args:
             backup_name (str, optional): Custom archive name to be deleted. Defaults to None.
             backup_path (str, optional): Custom absolute path were archives are saved. Defaults to None.
+            save_backup_info (bool, optional): Save backup info to file after deletion. Defaults to True.
 
         Returns:
             bool: True if the archive was deleted, False otherwise
@@ -524,29 +986,30 @@ class BackupManager():
             backup_name = self.backups["local_compressed"][0]
             
         if backup_path is None:
-            backup_path = os.path.join(self.target_path, backup_name)
+            backup_path = self._target_join(backup_name)
             
-        if not os.path.exists(backup_path):
-            logging.error(f"Backup {backup_path} does not exist")
-            return False
-        
         try:
             os.remove(backup_path)
             self.logger.debug(f"Backup {backup_path} deleted")
+        except FileNotFoundError:
+            self.logger.error(f"Backup {backup_path} does not exist")
+            return False
         except Exception as e:
             self.logger.error(e, exc_info=True)
             return False
         
         self.backups["local_compressed"].remove(backup_name)
-        self.save_backup_info_to_file()
+        if save_backup_info:
+            self.save_backup_info_to_file()
         
         return True
     
-    def delete_s3_raw_backup(self, backup_name: str = None) -> bool:
+    def delete_s3_raw_backup(self, backup_name: str = None, save_backup_info: bool = True) -> bool:
         """Function to delete a raw backup from S3
 
         Args:
             backup_name (str, optional): Custom backup name to be deleted. Defaults to None.
+            save_backup_info (bool, optional): Save backup info to file after deletion. Defaults to True.
 
         Returns:
             bool: True if the backup was deleted, False otherwise
@@ -565,15 +1028,17 @@ class BackupManager():
             return False
         
         self.backups["s3_raw"].remove(backup_name)
-        self.save_backup_info_to_file()
+        if save_backup_info:
+            self.save_backup_info_to_file()
         
         return True
     
-    def delete_s3_compressed_backup(self, backup_name: str = None) -> bool:
+    def delete_s3_compressed_backup(self, backup_name: str = None, save_backup_info: bool = True) -> bool:
         """Function to delete a compressed backup from S3
 
         Args:
             backup_name (str, optional): Custom archive name to be deleted. Defaults to None.
+            save_backup_info (bool, optional): Save backup info to file after deletion. Defaults to True.
 
         Returns:
             bool: True if the archive was deleted, False otherwise
@@ -592,7 +1057,8 @@ class BackupManager():
             return False
         
         self.backups["s3_compressed"].remove(backup_name)
-        self.save_backup_info_to_file()
+        if save_backup_info:
+            self.save_backup_info_to_file()
         
         return True
     
@@ -606,7 +1072,7 @@ class BackupManager():
         Returns:
             bool: True if the old backups were deleted, False otherwise
         """
-        if backup_type not in ["local_raw", "local_compressed", "s3_raw", "s3_compressed"]:
+        if backup_type not in BACKUP_TYPES:
             self.logger.error(f"Invalid backup type {backup_type}")
             return False
         
@@ -623,18 +1089,32 @@ class BackupManager():
         backups_to_delete = len(backups) - max_backups
         self.logger.debug(f"Deleting {backups_to_delete} old backups from {backup_type}")
         
-        for _ in range(backups_to_delete):
-            match backup_type:
-                case "local_raw":
-                    self.delete_raw_backup()
-                case "local_compressed":
-                    self.delete_compressed_backup()
-                case "s3_raw":
-                    self.delete_s3_raw_backup()
-                case "s3_compressed":
-                    self.delete_s3_compressed_backup()
+        match backup_type:
+            case "local_raw":
+                for _ in range(backups_to_delete):
+                    self.delete_raw_backup(save_backup_info=False)
+            case "local_compressed":
+                for _ in range(backups_to_delete):
+                    self.delete_compressed_backup(save_backup_info=False)
+            case "s3_raw" | "s3_compressed":
+                old_backups = backups[:backups_to_delete]
+                try:
+                    if backup_type == "s3_raw":
+                        keys = [key for backup in old_backups for key in self.s3handler.list_keys(backup + "/")]
+                    else:
+                        keys = old_backups
+                except Exception as e:
+                    self.logger.error(e, exc_info=True)
+                    return False
                 
-        return True
+                if not self.s3handler.delete_files(keys):
+                    self.logger.error(f"Old backups from {backup_type} not deleted")
+                    return False
+                
+                self.logger.debug(f"S3 backups {', '.join(old_backups)} deleted")
+                del backups[:backups_to_delete]
+                
+        return self.save_backup_info_to_file()
     
     def delete_old_backups(self) -> bool:
         """Function to delete old backups
@@ -657,7 +1137,9 @@ class BackupManager():
         
         return True
     
-    def convert_to_human_readable(self, size: int) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=2048)
+    def convert_to_human_readable(size: int) -> str:
         """Function to convert a size in bytes to human readable format
 
         Args:
@@ -669,8 +1151,8 @@ class BackupManager():
         if size == 0:
             return "0B"
         
-        power = int(math.log(size, 1024))
         units = ["B", "KB", "MB", "GB", "TB", "PB"]
+        power = min((int(size).bit_length() - 1) // 10, len(units) - 1)
         converted_size = round(size / 1024**power, 2)
         
         return f"{converted_size}{units[power]}"
@@ -687,18 +1169,19 @@ class BackupManager():
         if time == 0:
             return "0s"
         
-        power = int(math.log(time, 60))
         units = ["s", "m", "h"]
-        if power < 0:
+        if time < 60:
             power = 0
-        if power > len(units) - 1:
-            power = len(units) - 1
+        elif time < 3600:
+            power = 1
+        else:
+            power = 2
         converted_time = round(time / 60**power, 2)
         
         return f"{converted_time}{units[power]}"
     
     def get_backup_dir_size(self, backup_dir: str=None) -> int:
-        """Function to get the size of a backup directory
+        """Function to get the size of a backup directory, cached until the next backup is performed
 
         Args:
             backup_dir (str, optional): Custom backup directory to get the size from. Defaults to None.
@@ -711,29 +1194,68 @@ class BackupManager():
         """
         if backup_dir is None:
             backup_dir = self.target_path
+        
+        backup_dir_size = self._backup_dir_size_cache.get(backup_dir)
+        if backup_dir_size is not None:
+            return backup_dir_size
             
-        if not os.path.exists(backup_dir):
+        try:
+            backup_dir_size = self._scandir_size(backup_dir, set())
+        except FileNotFoundError as e:
             self.logger.error(f"Backup directory {backup_dir} does not exist")
-            raise FileNotFoundError(f"Backup directory {backup_dir} does not exist")        
-        
-        backup_dir_size = 0
-        
-        backup_dir_size = shutil.disk_usage(backup_dir).used
-        
-        # for root, _, files in os.walk(backup_dir):
-        #     for file in files:
-        #         try:
-        #             backup_dir_size += os.path.getsize(os.path.join(root, file))
-        #         except FileNotFoundError as e:
-        #             self.logger.error(f"File {os.path.join(root, file)} not found")
-        #         except Exception as e:
-        #             self.logger.error(e, exc_info=True)
-        #             raise e
+            raise FileNotFoundError(f"Backup directory {backup_dir} does not exist") from e
                 
         self.logger.debug(f"Backup directory {backup_dir} size: {self.convert_to_human_readable(backup_dir_size)}")
+        self._backup_dir_size_cache[backup_dir] = backup_dir_size
         
         return backup_dir_size
     
+    def _scandir_size(self, path: str, seen_inodes: set = None) -> int:
+        """Function to sum sizes of the files in a directory tree
+
+        Args:
+            path (str): Absolute path of the directory
+            seen_inodes (set, optional): (device, inode) pairs of hard linked files already counted, if given files hard linked more than once are counted once. Defaults to None.
+
+        Raises:
+            FileNotFoundError: Exception raised if the directory does not exist
+
+        Returns:
+            int: Size of the directory tree in bytes
+        """
+        size = 0
+        # Explicit stack instead of recursion, deep trees neither hit the recursion limit nor pay for a call per directory,
+        # directories are pushed with a flag marking the root, a missing root raises while removed subdirectories are logged
+        directories = [(path, True)]
+        while directories:
+            directory, is_root = directories.pop()
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                if is_root:
+                    raise
+                self.logger.error("File %s not found", directory)
+                continue
+            
+            with entries:
+                if self.scan_inode_order:
+                    entries = sorted(entries, key=lambda entry: entry.inode())
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append((entry.path, False))
+                        elif entry.is_file(follow_symlinks=False):
+                            entry_stat = entry.stat(follow_symlinks=False)
+                            if seen_inodes is not None and entry_stat.st_nlink > 1:
+                                inode = (entry_stat.st_dev, entry_stat.st_ino)
+                                if inode in seen_inodes:
+                                    continue
+                                seen_inodes.add(inode)
+                            size += entry_stat.st_size
+                    except FileNotFoundError:
+                        self.logger.error("File %s not found", entry.path)
+        return size
+    
     def get_last_backup_size(self) -> dict:
         """Function to get the size of the last backup
 
@@ -741,10 +1263,12 @@ class BackupManager():
             dict: Dictionary with the size of the last backup in raw and compressed format
         """
         backup_size = {}
-        backup_size["raw"] = self.convert_to_human_readable(self.get_backup_dir_size(os.path.join(self.target_path, self.backups["local_raw"][-1])))
+        backup_size["raw"] = self.convert_to_human_readable(self.get_backup_dir_size(self._target_join(self.backups["local_raw"][-1])))
         
-        if self.backups["local_compressed"][-1].startswith(self.backups["local_raw"][-1]):
-            backup_size["compressed"] = self.convert_to_human_readable(os.path.getsize(os.path.join(self.target_path, self.backups["local_compressed"][-1])))
+        archive_prefix = self.backups["local_raw"][-1] + "."
+        last_archive = self.backups["local_compressed"][-1] if self.backups["local_compressed"] else ""
+        if last_archive[:len(archive_prefix)] == archive_prefix and last_archive[len(archive_prefix):] in ARCHIVE_FORMATS:
+            backup_size["compressed"] = self.convert_to_human_readable(os.path.getsize(self._target_join(last_archive)))
         
         return backup_size
     
@@ -773,9 +1297,9 @@ class BackupManager():
             int: Size of the backup in bytes
         """
         if backup in self.backups["local_raw"]:
-            return self.get_backup_dir_size(os.path.join(self.target_path, backup))
+            return self.get_backup_dir_size(self._target_join(backup))
         elif backup in self.backups["local_compressed"]:
-            return os.path.getsize(os.path.join(self.target_path, backup))
+            return os.path.getsize(self._target_join(backup))
         
         return 0        
     
@@ -794,18 +1318,18 @@ class BackupManager():
         if backup_dir is None:
             backup_dir = self.target_path
             
-        if not os.path.exists(backup_dir):
+        try:
+            backup_dir_free_space = shutil.disk_usage(backup_dir).free
+        except FileNotFoundError as e:
             self.logger.error(f"Backup directory {backup_dir} does not exist")
-            raise FileNotFoundError(f"Backup directory {backup_dir} does not exist")        
-        
-        backup_dir_free_space = shutil.disk_usage(backup_dir).free
+            raise FileNotFoundError(f"Backup directory {backup_dir} does not exist") from e
         
         self.logger.debug(f"Backup directory free space: {self.convert_to_human_readable(backup_dir_free_space)}")
         
         return backup_dir_free_space
     
     def get_source_dir_size(self, source_path:str=None) -> int:
-        """Function to get the size of the source directory
+        """Function to get the size of the source directory, cached for SOURCE_SIZE_CACHE_TTL seconds
 
         Args:
             source_path (str, optional): Path to the source directory. Defaults to None.
@@ -819,16 +1343,38 @@ class BackupManager():
         if source_path is None:
             source_path = self.source_path
         
-        if not os.path.exists(source_path):
+        cached_size = self._source_size_cache.get(source_path)
+        if cached_size is not None and perf_counter() - cached_size[0] < SOURCE_SIZE_CACHE_TTL:
+            return cached_size[1]
+        
+        try:
+            entries = os.scandir(source_path)
+        except FileNotFoundError as e:
             self.logger.error(f"Source directory {source_path} does not exist")
-            raise FileNotFoundError(f"Source directory {source_path} does not exist")
+            raise FileNotFoundError(f"Source directory {source_path} does not exist") from e
         
         source_dir_size = 0
-        for root, _, files in os.walk(source_path):
-            for file in files:
-                source_dir_size += os.path.getsize(os.path.join(root, file))
+        with entries, ThreadPoolExecutor(max_workers=min(32, get_available_cpu_count() * 4)) as executor:
+            if self.scan_inode_order:
+                entries = sorted(entries, key=lambda entry: entry.inode())
+            futures = {}
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        futures[executor.submit(self._scandir_size, entry.path)] = entry.path
+                    elif entry.is_file(follow_symlinks=False):
+                        source_dir_size += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    self.logger.error("File %s not found", entry.path)
+            
+            for future, path in futures.items():
+                try:
+                    source_dir_size += future.result()
+                except FileNotFoundError:
+                    self.logger.error("File %s not found", path)
                 
         self.logger.debug(f"Source directory: {source_path} size: {self.convert_to_human_readable(source_dir_size)}")
+        self._source_size_cache[source_path] = (perf_counter(), source_dir_size)
         
         return source_dir_size
     
@@ -861,7 +1407,7 @@ class BackupManager():
         backup_info["backup_size"] = self.get_backups_size()
         
         if self.s3handler is not None:
-            backup_info["s3_bucket_size"] = self.convert_to_human_readable(self.s3handler.get_bucket_size())
+            backup_info["s3_bucket_size"] = backup_info["backup_size"]["s3"]
                 
             try:
                 if self.s3handler.check_directory_exists(self.backups["s3_raw"][-1]):
@@ -879,6 +1425,28 @@ class BackupManager():
                     
         return backup_info
            
+    def _build_backup_steps(self) -> list:
+        """Function to build the list of steps perform_backup runs between creating the raw backup and deleting old backups
+
+        Returns:
+            list: Tuples of step function, error message raised if the step fails and whether the step runs in background
+        """
+        backup_steps = []
+        if self.s3handler is not None:
+            # Uploads are network bound, raw backup is sent while the backup is being compressed
+            backup_steps.append((self.send_raw_backup_to_s3, "Failed to send raw backup to S3", True))
+        
+        if self.is_compression_enabled:
+            if self.s3handler is not None and self.compressed_backup_keep == 0 and self.s3_compressed_keep > 0:
+                # Local archive would be deleted right away, stream it to S3 instead of writing it to disk
+                backup_steps.append((self.compress_and_send_to_s3, "Failed to compress backup to S3", False))
+            else:
+                backup_steps.append((self.compress_backup, "Failed to compress backup", False))
+                if self.s3handler is not None:
+                    backup_steps.append((self.send_archive_to_s3, "Failed to send archive to S3", True))
+        
+        return backup_steps
+    
     def perform_backup(self)-> str:
         """Function to perform a backup
         
@@ -889,34 +1457,41 @@ class BackupManager():
             Exception: Exception raised if any of the backup steps fails
         """
         self.logger.info(f"Performing backup. Starting at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        self._source_size_cache.clear()
+        self._backup_dir_size_cache.clear()
         backup_start_time = perf_counter()
-        if not self.create_raw_backup():
-            raise Exception("Failed to create raw backup")
-        
-        compress_start_time = perf_counter()
-        if self.is_compression_enabled:
-            if not self.compress_backup():
-                raise Exception("Failed to compress backup")
-        compress_end_time = perf_counter()
-        
-        upload_start_time = perf_counter()
-        if self.s3handler is not None:
-            if not self.send_raw_backup_to_s3():
-                raise Exception("Failed to send raw backup to S3")
-            if self.is_compression_enabled:
-                if not self.send_archive_to_s3():
-                    raise Exception("Failed to send archive to S3")
-        upload_end_time = perf_counter()
-        
-        if not self.delete_old_backups():
-            raise Exception("Failed to delete old backups")
+        try:
+            if not self.create_raw_backup():
+                raise Exception("Failed to create raw backup")
+        
+            compress_start_time = perf_counter()
+            upload_start_time = compress_start_time
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                uploads = []
+                for step, error_message, in_background in self._backup_steps:
+                    if in_background:
+                        uploads.append((executor.submit(step), error_message))
+                    elif not step():
+                        raise Exception(error_message)
+                compress_end_time = perf_counter()
+            
+                for upload, error_message in uploads:
+                    if not upload.result():
+                        raise Exception(error_message)
+            upload_end_time = perf_counter()
+        
+            if not self.delete_old_backups():
+                raise Exception("Failed to delete old backups")
+        finally:
+            self._backup_dir_size_cache.clear()
         backup_end_time = perf_counter()
         
+        upload_concurrency = f" with {self.s3handler.upload_concurrency} parallel uploads" if self.s3handler is not None else ""
         response = f"\
 Backup performed in {self.convert_time_to_human_readable(backup_end_time - backup_start_time)}, \
 raw backup took {self.convert_time_to_human_readable(compress_start_time - backup_start_time)}, \
 compression took {self.convert_time_to_human_readable(compress_end_time - compress_start_time)}, \
-upload to S3 took {self.convert_time_to_human_readable(upload_end_time - upload_start_time)}, \
+upload to S3 took {self.convert_time_to_human_readable(upload_end_time - upload_start_time)}{upload_concurrency}, \
 deletion took {self.convert_time_to_human_readable(backup_end_time - upload_end_time)}"
 
         self.logger.info(response)
@@ -11,19 +11,127 @@ import os
 from s3_handler import S3Handler
 from telegram_handler import TelegramHandler
 from backups_manager import BackupManager
-from pprint import pformat
+import json
 from flask import Flask, render_template
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime
+from copy import deepcopy
+
+# Environment snapshot and config parsed from it, reused when PyBackUpper is created again in the same process
+_CONFIG_CACHE = None
+# Translation table deleting quotes from environment variable values
+_QUOTE_TABLE = str.maketrans('', '', '"')
+# Accepted values of boolean environment variables
+_BOOL = {"true": True, "false": False}
+# Secret files are tiny, one read usually returns the whole file
+SECRET_FILE_READ_SIZE = 4096
+
+def _clean(value: str) -> str:
+    """Function to strip whitespace and quotes from environment variable value.
+
+    Args:
+        value (str): Raw value of environment variable.
+
+    Returns:
+        str: Cleaned value.
+    """
+    return value.translate(_QUOTE_TABLE).strip()
+
+def _parse_bool(value: str) -> bool:
+    """Function to parse boolean environment variable value.
+
+    Args:
+        value (str): Cleaned value of environment variable.
+
+    Raises:
+        ValueError: Exception raised when value is neither true nor false.
+
+    Returns:
+        bool: Parsed value.
+    """
+    try:
+        return _BOOL[value.lower()]
+    except KeyError as e:
+        raise ValueError("must be either true or false") from e
+
+def _split_list(value: str) -> list:
+    """Function to split comma separated environment variable value, dropping quotes, whitespace around items and empty items.
+
+    Whitespace inside items is kept, so patterns like "My Documents" still match.
+
+    Args:
+        value (str): Raw value of environment variable.
+
+    Returns:
+        list: Items of the list.
+    """
+    items = (item.strip() for item in value.translate(_QUOTE_TABLE).split(","))
+    return [item for item in items if item]
+
+def _read_secret_file(path: str) -> str:
+    """Function to read secret from small file with raw os calls, skipping buffered text IO.
+
+    Args:
+        path (str): Path to secret file.
+
+    Returns:
+        str: Stripped content of secret file.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while chunk := os.read(fd, SECRET_FILE_READ_SIZE):
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+    return b"".join(chunks).decode().strip()
 
 class PyBackUpper():
     """PyBackUpper class.
     """
     
+    __slots__ = ("logger", "config", "s3_handler", "telegram_handler", "notification_queue", "backups_manager")
+    
     DAY_NAMES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
     
+    REQUIRED = object()
+    # Name, parse function, default value and allowed (min, max) range or frozenset of choices of environment variables,
+    # None max means there is no upper bound
+    ENV_VARIABLES = (
+        ("HOSTNAME", str, REQUIRED, None),
+        ("PUID", int, REQUIRED, (0, 65535)),
+        ("PGID", int, REQUIRED, (0, 65535)),
+        ("HOUR", int, REQUIRED, (0, 23)),
+        ("MINUTE", int, REQUIRED, (0, 59)),
+        ("LOCAL_RAW_BACKUPS_KEEP", int, 1, (0, None)),
+        ("S3_RAW_BACKUPS_KEEP", int, 0, (0, None)),
+        ("S3_BUCKET", str, None, None),
+        ("S3_ENDPOINT_URL", str, None, None),
+        ("S3_REGION_NAME", str, None, None),
+        ("S3_ACL", str, None, None),
+        ("S3_UPLOAD_CONCURRENCY", int, None, (1, None)),
+        ("S3_MULTIPART_CONCURRENCY", int, None, (1, None)),
+    )
+    # Secrets as (name, warning logged when not set), masked in print_config
+    SECRET_VARIABLES = (
+        ("S3_ACCESS_KEY_ID", "S3_ACCESS_KEY_ID not set. Defaulting to None."),
+        ("S3_SECRET_ACCESS_KEY", "S3_SECRET_ACCESS_KEY not set. Defaulting to None."),
+        ("TELEGRAM_TOKEN", "TELEGRAM_TOKEN not set. Telegram notifications disabled."),
+        ("TELEGRAM_CHAT_ID", "TELEGRAM_CHAT_ID not set. Telegram notifications disabled."),
+    )
+    # Environment variables read only when compression is enabled
+    COMPRESSION_ENV_VARIABLES = (
+        ("ARCHIVE_FORMAT", str, "tar.zst", frozenset({"tar", "tar.gz", "tar.bz2", "tar.xz", "tar.zst", "zip"})),
+        ("COMPRESSION_LEVEL", str.lower, "balanced", frozenset({"fast", "balanced", "archival"})),
+        ("LOCAL_COMPRESSED_BACKUPS_KEEP", int, 1, (0, None)),
+        ("S3_COMPRESSED_BACKUPS_KEEP", int, 0, (0, None)),
+        ("SKIP_INCOMPRESSIBLE", _parse_bool, False, None),
+    )
+    
     def __init__(self, logger:logging.Logger=None):
         """PyBackUpper constructor.
 
@@ -31,8 +139,10 @@ class PyBackUpper():
             logger (logging.Logger, optional): Logger to use. Defaults to None.
         """
         if logger is None:
-            logging.config.fileConfig("log.conf")
             self.logger = logging.getLogger('pybackupper_logger')
+            # log.conf is parsed only once per process, later instances reuse the configured logger
+            if not self.logger.handlers:
+                logging.config.fileConfig("log.conf")
         else:
             self.logger = logger
         self.logger.info("PyBackUpper initialized.")
@@ -47,32 +157,49 @@ class PyBackUpper():
                 self.config["S3_ACL"] if self.config["S3_ACL"] is not None else 'public-read',
                 self.config["S3_REGION_NAME"] if self.config["S3_REGION_NAME"] is not None else 'us-east-1',
                 self.config["S3_ENDPOINT_URL"] if self.config["S3_ENDPOINT_URL"] is not None else 'https://s3.amazonaws.com',
-                logger=self.logger)
-            if not self.s3_handler.test_connection():
-                self.logger.error("S3 connection test failed. S3 upload will not be available.")
-                self.s3_handler = None
-            else:
-                self.logger.info("S3 connection test successful.")
-            
+                logger=self.logger,
+                upload_concurrency=self.config["S3_UPLOAD_CONCURRENCY"],
+                multipart_concurrency=self.config["S3_MULTIPART_CONCURRENCY"])
         else:
             self.logger.warning("S3_BUCKET, S3_ACCESS_KEY and S3_SECRET_KEY not set. S3 upload will not be available.")
             self.s3_handler = None
         
         if self.config["TELEGRAM_TOKEN"] is not None and self.config["TELEGRAM_CHAT_ID"] is not None:
             self.telegram_handler = TelegramHandler(self.config["TELEGRAM_TOKEN"], self.config["TELEGRAM_CHAT_ID"], logger=self.logger)
-            if not self.telegram_handler.test_connection():
-                self.logger.error("Telegram connection test failed. Telegram notifications will not be available.")
-                self.telegram_handler = None
-            else:
-                self.logger.info("Telegram connection test successful.")
         else:
             self.logger.warning("TELEGRAM_TOKEN and TELEGRAM_CHAT_ID not set. Telegram notifications will not be available.")
+            self.telegram_handler = None
+        
+        # Connection tests are network round trips, run them at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            s3_test = executor.submit(self.s3_handler.test_connection) if self.s3_handler is not None else None
+            telegram_test = executor.submit(self.telegram_handler.test_connection) if self.telegram_handler is not None else None
+            
+            if s3_test is not None:
+                if not s3_test.result():
+                    self.logger.error("S3 connection test failed. S3 upload will not be available.")
+                    self.s3_handler = None
+                else:
+                    self.logger.info("S3 connection test successful.")
+            
+            if telegram_test is not None:
+                if not telegram_test.result():
+                    self.logger.error("Telegram connection test failed. Telegram notifications will not be available.")
+                    self.telegram_handler = None
+                else:
+                    self.logger.info("Telegram connection test successful.")
+        
+        self.notification_queue = queue.Queue()
+        if self.telegram_handler is not None:
+            threading.Thread(target=self.send_notifications, name="telegram_notifier", daemon=True).start()
             
         self.backups_manager = BackupManager(
             logger=self.logger,
             s3handler = self.s3_handler,
             is_compression_enabled = self.config["COMPRESSION_ENABLED"],
             archive_format = self.config["ARCHIVE_FORMAT"],
+            compression_level = self.config["COMPRESSION_LEVEL"],
+            skip_incompressible = self.config["SKIP_INCOMPRESSIBLE"],
             raw_backup_keep = self.config["LOCAL_RAW_BACKUPS_KEEP"],
             compressed_backup_keep = self.config["LOCAL_COMPRESSED_BACKUPS_KEEP"],
             s3_raw_keep = self.config["S3_RAW_BACKUPS_KEEP"],
@@ -94,228 +221,198 @@ class PyBackUpper():
             KeyError: Exception raised required environment variable is not set.
         """
         self.logger.info("Reading environment variables.")
+        # Environment does not change while the config is read, plain dict lookups are cheaper than os.environ ones
+        env = dict(os.environ)
         
-        try:
-            self.config["HOSTNAME"] = os.environ['HOSTNAME'].strip().replace('"', '')
-        except KeyError as e:
-            raise KeyError("HOSTNAME not set.") from e
+        global _CONFIG_CACHE
+        env_key = frozenset(env.items())
+        if _CONFIG_CACHE is not None and _CONFIG_CACHE[0] == env_key:
+            self.logger.info("Environment variables unchanged, using cached config.")
+            self.config = deepcopy(_CONFIG_CACHE[1])
+            # *_FILE secrets can be rotated without touching the environment, so they are never served from the cache
+            self.read_env_secrets(env)
+            return
         
-        try:
-            self.config["PUID"] = int(os.environ['PUID'].strip().replace('"', ''))
-            if self.config["PUID"] < 0 or self.config["PUID"] > 65535:
-                self.logger.error("Value of PUID must be between 0 and 65535, not %s", self.config["PUID"])
-                raise ValueError("Value of PUID must be between 0 and 65535")
-        except KeyError as e:
-            raise KeyError("PUID not set.") from e
-            
-        try:
-            self.config["PGID"] = int(os.environ['PGID'].strip().replace('"', ''))
-            if self.config["PGID"] < 0 or self.config["PGID"] > 65535:
-                self.logger.error("Value of PGID must be between 0 and 65535, not %s", self.config["PGID"])
-                raise ValueError("Value of PGID must be between 0 and 65535")
-        except KeyError as e:
-            raise KeyError("PGID not set.") from e
-            
-        try:
-            self.config["DAYS_TO_RUN"] = [int(x) for x in os.environ['DAYS_TO_RUN'].strip().replace('"', '').split(',')]
-            for day in self.config["DAYS_TO_RUN"]:
-                if day < 0 or day > 6:
-                    self.logger.error("Value of DAYS_TO_RUN must be between 0 and 6, not %s", day)
-                    raise ValueError("Value of DAYS_TO_RUN must be between 0 and 6")
-                
-            if len(self.config["DAYS_TO_RUN"]) != len(set(self.config["DAYS_TO_RUN"])):
+        # Variables left at their defaults are reported in a single warning once the config is read
+        defaulted = []
+        for name, parse, default, limits in self.ENV_VARIABLES:
+            self.config[name] = self.read_env_variable(env, name, parse, default, limits, defaulted)
+        
+        days_to_run = env.get('DAYS_TO_RUN')
+        if days_to_run is None:
+            raise KeyError("DAYS_TO_RUN not set.")
+        
+        # Range and duplicates are checked in the same pass that parses the days
+        self.config["DAYS_TO_RUN"] = []
+        seen_days = set()
+        for day in map(int, _split_list(days_to_run)):
+            if not 0 <= day <= 6:
+                self.logger.error("Value of DAYS_TO_RUN must be between 0 and 6, not %s", day)
+                raise ValueError("Value of DAYS_TO_RUN must be between 0 and 6")
+            if day in seen_days:
                 self.logger.error("DAYS_TO_RUN contains duplicates.")
                 raise ValueError("DAYS_TO_RUN contains duplicates")
+            seen_days.add(day)
+            self.config["DAYS_TO_RUN"].append(day)
         
-        except KeyError as e:
-            raise KeyError("DAYS_TO_RUN not set.") from e
-            
-        try:
-            self.config["HOUR"] = int(os.environ['HOUR'].strip().replace('"', ''))
-            if self.config["HOUR"] < 0 or self.config["HOUR"] > 23:
-                self.logger.error("Value of HOUR must be between 0 and 23, not %s", self.config["HOUR"])
-                raise ValueError("Value of HOUR must be between 0 and 23")
-        except KeyError as e:
-            raise KeyError("HOUR not set.") from e
-            
-        try:
-            self.config["MINUTE"] = int(os.environ['MINUTE'].strip().replace('"', ''))
-            if self.config["MINUTE"] < 0 or self.config["MINUTE"] > 59:
-                self.logger.error("Value of MINUTE must be between 0 and 59, not %s", self.config["MINUTE"])
-                raise ValueError("Value of MINUTE must be between 0 and 59")
-        except KeyError as e:
-            raise KeyError("MINUTE not set.") from e
+        if not self.config["DAYS_TO_RUN"]:
+            self.logger.error("DAYS_TO_RUN must contain at least one day.")
+            raise ValueError("DAYS_TO_RUN must contain at least one day")
             
-        try:
-            if os.environ['COMPRESSION_ENABLED'].strip().replace('"', '').lower() == "true":
-                self.config["COMPRESSION_ENABLED"] = True
-            elif os.environ['COMPRESSION_ENABLED'].strip().replace('"', '').lower() == "false":
-                self.config["COMPRESSION_ENABLED"] = False
-            else:
+        compression_enabled = env.get('COMPRESSION_ENABLED')
+        if compression_enabled is None:
+            defaulted.append("COMPRESSION_ENABLED=true")
+            compression_enabled = True
+        else:
+            try:
+                compression_enabled = _BOOL[_clean(compression_enabled).lower()]
+            except KeyError as e:
                 self.logger.error("COMPRESSION_ENABLED must be either true or false.")
-                raise ValueError("COMPRESSION_ENABLED must be either true or false")
-        except KeyError:
-            self.logger.warning("COMPRESSION_ENABLED not set. Defaulting to true.")
-            self.config["COMPRESSION_ENABLED"] = True
+                raise ValueError("COMPRESSION_ENABLED must be either true or false") from e
+        self.config["COMPRESSION_ENABLED"] = compression_enabled
             
-        if self.config["COMPRESSION_ENABLED"]:
-            try:
-                self.config["ARCHIVE_FORMAT"] = os.environ['ARCHIVE_FORMAT'].strip().replace('"', '')
-                if self.config["ARCHIVE_FORMAT"] not in ["tar", "tar.gz", "tar.bz2", "tar.xz", "zip"]:
-                    self.logger.error("ARCHIVE_FORMAT must be one of tar, tar.gz, tar.bz2, tar.xz, zip, not %s", self.config["ARCHIVE_FORMAT"])
-                    raise ValueError("ARCHIVE_FORMAT must be one of tar, tar.gz, tar.bz2, tar.xz, zip")
-            except KeyError:
-                self.logger.warning("ARCHIVE_FORMAT not set. Defaulting to tar.gz.")
-                self.config["ARCHIVE_FORMAT"] = "tar.gz"
+        if compression_enabled:
+            for name, parse, default, limits in self.COMPRESSION_ENV_VARIABLES:
+                self.config[name] = self.read_env_variable(env, name, parse, default, limits, defaulted)
         else:
             self.config["ARCHIVE_FORMAT"] = None
-            
-        try:
-            self.config["LOCAL_RAW_BACKUPS_KEEP"] = int(os.environ['LOCAL_RAW_BACKUPS_KEEP'].strip().replace('"', ''))
-            if self.config["LOCAL_RAW_BACKUPS_KEEP"] < 0:
-                self.logger.error("Value of LOCAL_RAW_BACKUPS_KEEP must be at least 0, not %s", self.config["LOCAL_RAW_BACKUPS_KEEP"])
-                raise ValueError("Value of LOCAL_RAW_BACKUPS_KEEP must be at least 0")
-        except KeyError:
-            self.logger.warning("LOCAL_RAW_BACKUPS_KEEP not set. Defaulting to 1.")
-            self.config["LOCAL_RAW_BACKUPS_KEEP"] = 1
-            
-        if self.config["COMPRESSION_ENABLED"]:
-            try:
-                self.config["LOCAL_COMPRESSED_BACKUPS_KEEP"] = int(os.environ['LOCAL_COMPRESSED_BACKUPS_KEEP'].strip().replace('"', ''))
-                if self.config["LOCAL_COMPRESSED_BACKUPS_KEEP"] < 0:
-                    self.logger.error("Value of LOCAL_COMPRESSED_BACKUPS_KEEP must be at least 0, not %s", self.config["LOCAL_COMPRESSED_BACKUPS_KEEP"])
-                    raise ValueError("Value of LOCAL_COMPRESSED_BACKUPS_KEEP must be at least 0")
-            except KeyError:
-                self.logger.warning("LOCAL_COMPRESSED_BACKUPS_KEEP not set. Defaulting to 1.")
-                self.config["LOCAL_COMPRESSED_BACKUPS_KEEP"] = 1
-        else:
+            self.config["COMPRESSION_LEVEL"] = "balanced"
             self.config["LOCAL_COMPRESSED_BACKUPS_KEEP"] = 0
-            
-        try:
-            self.config["S3_RAW_BACKUPS_KEEP"] = int(os.environ['S3_RAW_BACKUPS_KEEP'].strip().replace('"', ''))
-            if self.config["S3_RAW_BACKUPS_KEEP"] < 0:
-                self.logger.error("Value of S3_RAW_BACKUPS_KEEP must be at least 0, not %s", self.config["S3_RAW_BACKUPS_KEEP"])
-                raise ValueError("Value of S3_RAW_BACKUPS_KEEP must be at least 0")
-        except KeyError:
-            self.logger.warning("S3_RAW_BACKUPS_KEEP not set. Defaulting to 0.")
-            self.config["S3_RAW_BACKUPS_KEEP"] = 0
-            
-        if self.config["COMPRESSION_ENABLED"]:
-            try:
-                self.config["S3_COMPRESSED_BACKUPS_KEEP"] = int(os.environ['S3_COMPRESSED_BACKUPS_KEEP'].strip().replace('"', ''))
-                if self.config["S3_COMPRESSED_BACKUPS_KEEP"] < 0:
-                    self.logger.error("Value of S3_COMPRESSED_BACKUPS_KEEP must be at least 0, not %s", self.config["S3_COMPRESSED_BACKUPS_KEEP"])
-                    raise ValueError("Value of S3_COMPRESSED_BACKUPS_KEEP must be at least 0")
-            except KeyError:
-                self.logger.warning("S3_COMPRESSED_BACKUPS_KEEP not set. Defaulting to 0.")
-                self.config["S3_COMPRESSED_BACKUPS_KEEP"] = 0
-        else:
             self.config["S3_COMPRESSED_BACKUPS_KEEP"] = 0
-        
-        try:
-            self.config["S3_BUCKET"] = os.environ['S3_BUCKET'].strip().replace('"', '')
-        except KeyError as e:
-            self.logger.warning("S3_BUCKET not set.")
-            self.config["S3_BUCKET"] = None
-            
-        try:
-            self.config["S3_ENDPOINT_URL"] = os.environ['S3_ENDPOINT_URL'].strip().replace('"', '')
-        except KeyError:
-            self.logger.warning("S3_ENDPOINT_URL not set. Defaulting to None.")
-            self.config["S3_ENDPOINT_URL"] = None
-            
+            self.config["SKIP_INCOMPRESSIBLE"] = False
             
-        try:
-            with open(os.environ['S3_ACCESS_KEY_ID_FILE'].strip().replace('"', ''), 'r') as f:
-                self.config["S3_ACCESS_KEY_ID"] = f.read().strip()
-        except (FileNotFoundError, KeyError):
-            try:
-                self.config["S3_ACCESS_KEY_ID"] = os.environ['S3_ACCESS_KEY_ID'].strip().replace('"', '')
-            except KeyError:
-                self.logger.warning("S3_ACCESS_KEY_ID not set. Defaulting to None.")
-                self.config["S3_ACCESS_KEY_ID"] = None
+        self.config["IGNORED_EXTENSIONS"] = _split_list(env.get('IGNORED_EXTENSIONS', ''))
         
-        try:
-            with open(os.environ['S3_SECRET_ACCESS_KEY_FILE'].strip().replace('"', ''), 'r') as f:
-                self.config["S3_SECRET_ACCESS_KEY"] = f.read().strip()
-        except (FileNotFoundError, KeyError) as e:
-            print(e)
-            try:
-                self.config["S3_SECRET_ACCESS_KEY"] = os.environ['S3_SECRET_ACCESS_KEY'].strip().replace('"', '')
-            except KeyError:
-                self.logger.warning("S3_SECRET_ACCESS_KEY not set. Defaulting to None.")
-                self.config["S3_SECRET_ACCESS_KEY"] = None
-            
-        try:
-            self.config["S3_REGION_NAME"] = os.environ['S3_REGION_NAME'].strip().replace('"', '')
-        except KeyError:
-            self.logger.warning("S3_REGION_NAME not set. Defaulting to None.")
-            self.config["S3_REGION_NAME"] = None
+        if defaulted:
+            self.logger.warning("Environment variables not set, using defaults: %s", ", ".join(defaulted))
+        
+        _CONFIG_CACHE = (env_key, deepcopy(self.config))
+        self.read_env_secrets(env)
+    
+    def read_env_variable(self, env: dict, name: str, parse, default, limits, defaulted: list):
+        """Reads single environment variable described by ENV_VARIABLES entry.
+
+        Args:
+            env (dict): Snapshot of environment variables.
+            name (str): Name of environment variable.
+            parse (callable): Function converting cleaned value, e.g. int.
+            default: Value used when variable is not set, REQUIRED if variable must be set.
+            limits (tuple | frozenset): Allowed (min, max) range for int values or frozenset of allowed choices, None if value is not checked.
+            defaulted (list): List to which NAME=default is appended when variable is not set.
+
+        Raises:
+            ValueError: Exception raised when environment variable has invalid value.
+            KeyError: Exception raised when required environment variable is not set.
+
+        Returns:
+            Parsed value of environment variable.
+        """
+        value = env.get(name)
+        if value is None:
+            if default is self.REQUIRED:
+                raise KeyError(f"{name} not set.")
+            defaulted.append(f"{name}={default}")
+            return default
         
         try:
-            self.config["S3_ACL"] = os.environ['S3_ACL'].strip().replace('"', '')
-        except KeyError:
-            self.logger.warning("S3_ACL not set. Defaulting to None.")
-            self.config["S3_ACL"] = None
-            
-        try:
-            self.config["IGNORED_EXTENSIONS"] = os.environ['IGNORED_EXTENSIONS'].strip().replace('"', '')
-            if self.config["IGNORED_EXTENSIONS"] == "":
-                self.config["IGNORED_EXTENSIONS"] = []
-            else:
-                self.config["IGNORED_EXTENSIONS"] = self.config["IGNORED_EXTENSIONS"].split(",")
-        except KeyError:
-            self.config["IGNORED_EXTENSIONS"] = []
-      
-        try:
-            with open(os.environ['TELEGRAM_TOKEN_FILE'].strip().replace('"', ''), 'r') as f:
-                self.config["TELEGRAM_TOKEN"] = f.read().strip()
-        except (FileNotFoundError, KeyError):      
-            try:
-                self.config["TELEGRAM_TOKEN"] = os.environ['TELEGRAM_TOKEN'].strip().replace('"', '')
-            except KeyError:
-                self.logger.warning("TELEGRAM_TOKEN not set. Telegram notifications disabled.")
-                self.config["TELEGRAM_TOKEN"] = None
-                
-        try:
-            with open(os.environ['TELEGRAM_CHAT_ID_FILE'].strip().replace('"', ''), 'r') as f:
-                self.config["TELEGRAM_CHAT_ID"] = f.read().strip()
-        except (FileNotFoundError, KeyError):   
-            try:
-                self.config["TELEGRAM_CHAT_ID"] = os.environ['TELEGRAM_CHAT_ID'].strip().replace('"', '')
-            except KeyError:
-                self.logger.warning("TELEGRAM_CHAT_ID not set. Telegram notifications disabled.")
-                self.config["TELEGRAM_CHAT_ID"] = None
+            value = parse(_clean(value))
+        except ValueError as e:
+            self.logger.error("Value of %s is invalid, %s", name, e)
+            raise ValueError(f"Value of {name} is invalid, {e}") from e
+        if limits is None:
+            return value
+        
+        if parse is int:
+            low, high = limits
+            if high is None and value < low:
+                self.logger.error("Value of %s must be at least %s, not %s", name, low, value)
+                raise ValueError(f"Value of {name} must be at least {low}")
+            if high is not None and not low <= value <= high:
+                self.logger.error("Value of %s must be between %s and %s, not %s", name, low, high, value)
+                raise ValueError(f"Value of {name} must be between {low} and {high}")
+        elif value not in limits:
+            choices = ", ".join(sorted(limits))
+            self.logger.error("%s must be one of %s, not %s", name, choices, value)
+            raise ValueError(f"{name} must be one of {choices}")
+        
+        return value
     
-    def print_config(self) -> str:
-        config = self.config.copy()
+    def read_env_secrets(self, env: dict):
+        """Reads all secrets listed in SECRET_VARIABLES and stores them in self.config.
+
+        Args:
+            env (dict): Snapshot of environment variables.
+        """
+        for name, not_set_message in self.SECRET_VARIABLES:
+            self.config[name] = self.read_env_secret(env, name, not_set_message)
+    
+    def read_env_secret(self, env: dict, name: str, not_set_message: str):
+        """Reads secret from file set in NAME_FILE environment variable, falls back to NAME environment variable.
+
+        Args:
+            env (dict): Snapshot of environment variables.
+            name (str): Name of environment variable holding the secret.
+            not_set_message (str): Warning logged when secret is not set.
+
+        Returns:
+            str: Secret value, None if secret is not set.
+        """
+        # Files are only opened when configured, unset secrets cost neither syscalls nor exceptions
+        if f"{name}_FILE" in env:
+            secret_file = _clean(env[f"{name}_FILE"])
+            try:
+                return _read_secret_file(secret_file)
+            except FileNotFoundError:
+                self.logger.warning("%s_FILE %s not found, trying %s.", name, secret_file, name)
         
-        if config["S3_ACCESS_KEY_ID"] is not None:
-            config["S3_ACCESS_KEY_ID"] = "********"
-            
-        if config["S3_SECRET_ACCESS_KEY"] is not None:
-            config["S3_SECRET_ACCESS_KEY"] = "********"
-            
-        if config["TELEGRAM_TOKEN"] is not None:
-            config["TELEGRAM_TOKEN"] = "********"
+        if name in env:
+            return _clean(env[name])
         
-        if config["TELEGRAM_CHAT_ID"] is not None:
-            config["TELEGRAM_CHAT_ID"] = "********"
-            
-        return pformat(config, sort_dicts=False)
+        self.logger.warning(not_set_message)
+        return None
+    
+    def print_config(self) -> str:
+        # Only the set secrets are masked, the rest of the config is passed through without copying it first
+        masked = {name: "********" for name, _ in self.SECRET_VARIABLES if self.config[name] is not None}
+        return json.dumps({**self.config, **masked}, indent=2, default=str)
+    
+    def notify(self, send, *args):
+        """Queues Telegram notification so it is sent without blocking the caller.
+
+        Args:
+            send (callable): TelegramHandler method used to send the notification.
+            *args: Arguments passed to send.
+        """
+        if self.telegram_handler is not None:
+            self.notification_queue.put_nowait((send, args))
+    
+    def send_notifications(self):
+        """Sends queued Telegram notifications, runs in a background daemon thread.
+        """
+        while True:
+            send, args = self.notification_queue.get()
+            try:
+                send(*args)
+            except Exception:
+                self.logger.exception("Failed to send Telegram notification.")
+            finally:
+                self.notification_queue.task_done()
     
     def create_backup(self):
         try:
-            response = pybackupper.backups_manager.perform_backup()
+            response = self.backups_manager.perform_backup()
             if response is not None and response != "":
-                pybackupper.logger.info("Backup completed successfully.")
-                pybackupper.telegram_handler.send_backup_info(pybackupper.config["HOSTNAME"], response, pybackupper.backups_manager.get_backup_info())
+                self.logger.info("Backup completed successfully.")
+                if self.telegram_handler is not None:
+                    self.notify(self.telegram_handler.send_backup_info, self.config["HOSTNAME"], response, self.backups_manager.get_backup_info())
             else:
-                pybackupper.logger.error("Backup failed.")
-                pybackupper.telegram_handler.send_message(pybackupper.config["HOSTNAME"] + ": Backup failed.")
+                self.logger.error("Backup failed.")
+                if self.telegram_handler is not None:
+                    self.notify(self.telegram_handler.send_message, self.config["HOSTNAME"] + ": Backup failed.")
         except Exception as e:
-            pybackupper.telegram_handler.send_message(pybackupper.config["HOSTNAME"] + ": Error occured while creating a backup.")
-            pybackupper.logger.exception("Error occured while creating a backup.")
+            if self.telegram_handler is not None:
+                self.notify(self.telegram_handler.send_message, self.config["HOSTNAME"] + ": Error occured while creating a backup.")
+            self.logger.exception("Error occured while creating a backup.")
 
     def run(self):
         days_string = ','.join([self.DAY_NAMES[day] for day in self.config["DAYS_TO_RUN"]])
@@ -334,7 +431,7 @@ class PyBackUpper():
         self.display_webpage(cron_trigger)
         self.logger.info("Next backup will be created on " + cron_trigger.get_next_fire_time(datetime.now(), datetime.now()).strftime("%d/%m/%Y %H:%M:%S"))
         if self.telegram_handler is not None:
-            self.telegram_handler.send_message(self.config["HOSTNAME"] + ": PyBackUpper started. Next backup will be created on " + cron_trigger.get_next_fire_time(datetime.now(), datetime.now()).strftime("%d/%m/%Y %H:%M:%S"))
+            self.notify(self.telegram_handler.send_message, self.config["HOSTNAME"] + ": PyBackUpper started. Next backup will be created on " + cron_trigger.get_next_fire_time(datetime.now(), datetime.now()).strftime("%d/%m/%Y %H:%M:%S"))
         sched.start()
     
     def display_webpage(self, cron_trigger: CronTrigger):
@@ -1,24 +1,39 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import logging
 import logging.config
 import os
 import concurrent.futures
+from system_resources import get_available_cpu_count
+
+MULTIPART_CHUNK_SIZE = 64 * 1024 * 1024
+MIN_POOL_CONNECTIONS = 10
 
 class S3Handler:
-    def __init__(self, bucket_name, access_key, secret_key, acl='public-read', region='us-east-1', url='https://s3.amazonaws.com', logger: logging.Logger = None):
+    def __init__(self, bucket_name, access_key, secret_key, acl='public-read', region='us-east-1', url='https://s3.amazonaws.com', logger: logging.Logger = None, upload_concurrency: int = None, multipart_concurrency: int = None):
+        self.upload_concurrency = upload_concurrency if upload_concurrency is not None else 2*get_available_cpu_count()
+        self.multipart_concurrency = multipart_concurrency if multipart_concurrency is not None else get_available_cpu_count()
+        # Every parallel file upload may send multipart_concurrency parts at once and the archive upload runs next to them,
+        # the default pool of 10 connections would drop and reopen connections instead of reusing them
+        max_pool_connections = (self.upload_concurrency + 1) * self.multipart_concurrency
         self.client = boto3.client(
             's3',
             aws_access_key_id=access_key,
             aws_secret_access_key=secret_key,
             region_name=region,
-            endpoint_url=url
+            endpoint_url=url,
+            config=Config(max_pool_connections=max(MIN_POOL_CONNECTIONS, max_pool_connections))
         )
         self.bucket_name = bucket_name
         self.acl = acl
+        self.transfer_config = TransferConfig(multipart_chunksize=MULTIPART_CHUNK_SIZE, max_concurrency=self.multipart_concurrency, use_threads=True)
         
         if logger is None:
-            logging.config.fileConfig("log.conf")
             self.logger = logging.getLogger('pybackupper_logger')
+            # log.conf is parsed only once per process, later instances reuse the configured logger
+            if not self.logger.handlers:
+                logging.config.fileConfig("log.conf")
         else:
             self.logger = logger
     
@@ -26,56 +41,101 @@ class S3Handler:
         if object_name is None:
             object_name = os.path.basename(file_name)
         
-        self.logger.debug(f"Uploading file {file_name} to {object_name}")
+        self.logger.debug("Uploading file %s to %s", file_name, object_name)
+        try:
+            _ = self.client.upload_file(file_name, self.bucket_name, object_name, ExtraArgs={'ACL': self.acl}, Config=self.transfer_config)
+            self.logger.debug("File %s uploaded successfully", file_name)
+        except Exception as e:
+            self.logger.error(e, exc_info=True)
+            return False
+        return True
+        
+    def upload_fileobj(self, fileobj, object_name):
+        self.logger.debug(f"Uploading stream to {object_name}")
         try:
-            _ = self.client.upload_file(file_name, self.bucket_name, object_name, ExtraArgs={'ACL': self.acl})
-            self.logger.debug(f"File {file_name} uploaded successfully")
+            self.client.upload_fileobj(fileobj, self.bucket_name, object_name, ExtraArgs={'ACL': self.acl}, Config=self.transfer_config)
+            self.logger.debug(f"Stream uploaded successfully to {object_name}")
         except Exception as e:
             self.logger.error(e, exc_info=True)
             return False
         return True
         
-    def upload_directory(self, directory_path, object_name=None):
+    def upload_directory(self, directory_path, object_name=None) -> bool:
         if object_name is None:
             object_name = os.path.basename(directory_path)
             
         self.logger.debug(f"Uploading directory {directory_path} to {object_name}")
 
+        uploads = []
+        directories = [directory_path]
         try:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2*os.cpu_count()) as executor:
-                for path, _, files in os.walk(directory_path):
-                    dest_path = path.replace(directory_path, "")
-                    for file in files:                        
-                        s3file = os.path.normpath(object_name + '/' + dest_path + '/' + file)
-                        local_file = os.path.join(path, file)
-                        self.logger.debug(f"upload : {local_file} to target: {s3file}")
-                        executor.submit(self.upload_file, local_file, s3file)
+            while directories:
+                with os.scandir(directories.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif entry.is_file():
+                            s3file = os.path.normpath(object_name + '/' + entry.path[len(directory_path):])
+                            self.logger.debug("upload : %s to target: %s", entry.path, s3file)
+                            uploads.append((entry.path, s3file))
         except Exception as e:
             self.logger.error(e, exc_info=True)
-            raise e
+            return False
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.upload_concurrency) as executor:
+            futures = [executor.submit(self.upload_file, local_file, s3file) for local_file, s3file in uploads]
+            for future in concurrent.futures.as_completed(futures):
+                if not future.result():
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    self.logger.error(f"Upload of directory {directory_path} failed, remaining uploads cancelled")
+                    return False
+        return True
     
     def delete_file(self, file_name):
         try:
             _ = self.client.delete_object(Bucket=self.bucket_name, Key=file_name)
-            self.logger.debug(f"File {file_name} deleted successfully")
+            self.logger.debug("File %s deleted successfully", file_name)
         except Exception as e:
             self.logger.error(e, exc_info=True)
             return False
         return True
     
-    def delete_directory(self, directory_path):
+    def delete_files(self, file_names) -> bool:
         try:
-            response = self.client.list_objects_v2(Bucket=self.bucket_name, Prefix=directory_path)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2*os.cpu_count()) as executor:
-                for content in response['Contents']:
-                    if content['Key'].find('/') != -1:
-                        self.logger.debug(f"Deleting file {content['Key']}")
-                        executor.submit(self.delete_file, content['Key'])
+            for i in range(0, len(file_names), 1000):
+                response = self.client.delete_objects(Bucket=self.bucket_name,
+                                                      Delete={'Objects': [{'Key': file_name} for file_name in file_names[i:i + 1000]],
+                                                              'Quiet': True})
+                for error in response.get('Errors', []):
+                    self.logger.error("File %s not deleted: %s", error['Key'], error['Message'])
+                if response.get('Errors'):
+                    return False
+            self.logger.debug(f"{len(file_names)} files deleted successfully")
         except Exception as e:
             self.logger.error(e, exc_info=True)
             return False
         return True
     
+    def list_keys(self, prefix) -> list:
+        keys = []
+        try:
+            paginator = self.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                for content in page.get('Contents', []):
+                    keys.append(content['Key'])
+        except Exception as e:
+            self.logger.error(e, exc_info=True)
+            raise e
+        return keys
+    
+    def delete_directory(self, directory_path):
+        try:
+            keys = self.list_keys(directory_path.rstrip('/') + '/')
+        except Exception:
+            return False
+        self.logger.debug(f"Deleting {len(keys)} files from {directory_path}")
+        return self.delete_files(keys)
+    
     def list_buckets(self):
         try:
             response = self.client.list_buckets()
@@ -124,6 +184,21 @@ class S3Handler:
             return []
         return directories
     
+    def list_root(self) -> tuple:
+        directories = []
+        files = []
+        try:
+            paginator = self.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Delimiter='/'):
+                for content in page.get('CommonPrefixes', []):
+                    directories.append(content['Prefix'].replace('/', ''))
+                for content in page.get('Contents', []):
+                    files.append(content['Key'])
+        except Exception as e:
+            self.logger.error(e, exc_info=True)
+            return [], []
+        return directories, files
+    
     def list_tree(self, prefix=None) -> list:
         tree = []
         try:
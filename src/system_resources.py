@@ -0,0 +1,27 @@
+"""Module with helpers describing resources available to the process.
+"""
+import os
+import math
+from multiprocessing import cpu_count
+
+CGROUP_CPU_MAX_FILE = "/sys/fs/cgroup/cpu.max"
+
+def get_available_cpu_count() -> int:
+    """Function to get number of CPUs the process may use, respecting CPU affinity and cgroup v2 CPU quota
+
+    Returns:
+        int: Number of available CPUs
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = cpu_count()
+    
+    try:
+        with open(CGROUP_CPU_MAX_FILE) as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
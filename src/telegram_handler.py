@@ -21,8 +21,10 @@ class TelegramHandler():
             ValueError: Exception raised when required argument has invalid value.
         """
         if logger is None:
-            logging.config.fileConfig("log.conf")
             self.logger = logging.getLogger('pybackupper_logger')
+            # log.conf is parsed only once per process, later instances reuse the configured logger
+            if not self.logger.handlers:
+                logging.config.fileConfig("log.conf")
         else:
             self.logger = logger
             